@@ -16,10 +16,14 @@ Licensed under BSD license shown in LICENSE
 
 
 import csv
+import functools
+import os
 import sys
 import argparse
 import numpy
 import matplotlib.pyplot
+import matplotlib.collections
+import matplotlib.lines
 import matplotlib
 matplotlib.rc('font', family='Arial')
 
@@ -28,7 +32,49 @@ matplotlib.rc('font', family='Arial')
 # The following constants define the span of the intensity axis
 START = -4
 STOP = 6
-N = abs(STOP - START + 1)
+# Arithmetic intensity axis (exact powers of two) and performance axis ticks.
+# The rooflines are plotted on log2 axes, so they are computed in float32
+ARITHMETIC_INTENSITY = numpy.ldexp(numpy.float32(1.0),
+                                   numpy.arange(START, STOP + 1))
+YTICKS = numpy.ldexp(1.0, numpy.arange(-5, 21))
+# Layout of a HW platform record: name, peak performance (GFLOP/s),
+# peak bandwidth (GB/s) and price ($). The name is kept as a Python string
+# so that it is never truncated
+HW_DTYPE = [('name', 'O'), ('perf', 'f8'), ('bw', 'f8'), ('price', 'f8')]
+# Read buffer size for the apps CSV file, which is consumed line by line,
+# large enough to read typical files with a single read() call
+BUFFER_SIZE = 1 << 20
+# Minimum size of a HW CSV file for which PyArrow's parser is used. Importing
+# pyarrow takes ~0.08 s, which its faster parsing only recovers from ~3 MB on
+ARROW_MIN_FILE_SIZE = 4 << 20
+# Minimum number of platforms for which the JIT-compiled roofline kernel is
+# used. Importing numba takes ~0.25 s and loading the kernel from its on-disk
+# cache another ~0.2 s, and roofline() runs once per plot, so the kernel only
+# pays off from ~1e7 platforms (measured with numba 0.68 and numpy 2.4)
+JIT_MIN_PLATFORMS = 10 ** 7
+
+
+@functools.lru_cache(maxsize=None)
+def jit_roofline_kernel():
+    """
+    Returns the JIT-compiled roofline kernel, or None if numba is missing.
+    numba is only imported here since its import alone costs ~0.25 s
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def roofline_kernel(peak_performance, peak_bandwidth, intensity, out):
+        """
+        Computes the roofline model into out, one platform per row
+        """
+        for i in numba.prange(out.shape[0]):
+            for j in range(out.shape[1]):
+                out[i, j] = min(peak_performance[i],
+                                peak_bandwidth[i] * intensity[j])
+    return roofline_kernel
 
 
 def roofline(num_platforms, peak_performance, peak_bandwidth, intensity):
@@ -37,17 +83,26 @@ def roofline(num_platforms, peak_performance, peak_bandwidth, intensity):
     Returns The achievable performance
     """
 
-    assert isinstance(num_platforms, int) and num_platforms > 0
-    assert isinstance(peak_performance, numpy.ndarray)
-    assert isinstance(peak_bandwidth, numpy.ndarray)
-    assert isinstance(intensity, numpy.ndarray)
-    assert (num_platforms == peak_performance.shape[0] and
-            num_platforms == peak_bandwidth.shape[0])
+    # A single short-circuiting check, stripped entirely under python -O
+    assert (isinstance(num_platforms, int) and num_platforms > 0 and
+            isinstance(intensity, numpy.ndarray) and intensity.ndim == 1 and
+            isinstance(peak_performance, numpy.ndarray) and
+            isinstance(peak_bandwidth, numpy.ndarray) and
+            peak_performance.shape == peak_bandwidth.shape == (num_platforms,))
 
-    achievable_perf = numpy.zeros((num_platforms, len(intensity)))
-    for i in range(num_platforms):
-        achievable_perf[i:] = numpy.minimum(peak_performance[i],
-                                            peak_bandwidth[i] * intensity)
+    # Every element is written below, so the result is left uninitialized
+    achievable_perf = numpy.empty((num_platforms, len(intensity)),
+                                  dtype=numpy.result_type(peak_performance,
+                                                          peak_bandwidth,
+                                                          intensity))
+    kernel = (jit_roofline_kernel() if num_platforms >= JIT_MIN_PLATFORMS
+              else None)
+    if kernel is not None:
+        kernel(peak_performance, peak_bandwidth, intensity, achievable_perf)
+    else:
+        numpy.multiply.outer(peak_bandwidth, intensity, out=achievable_perf)
+        numpy.minimum(achievable_perf, peak_performance.reshape(-1, 1),
+                      out=achievable_perf)
     return achievable_perf
 
 
@@ -55,28 +110,24 @@ def process(hw_platforms, apps, xkcd):
     """
     Processes the hw_platforms and apps to plot the Roofline.
     """
-    assert isinstance(hw_platforms, list)
+    assert isinstance(hw_platforms, numpy.ndarray)
     assert isinstance(apps, list)
     assert isinstance(xkcd, bool)
 
-    # arithmetic intensity
-    arithmetic_intensity = numpy.logspace(START, STOP, num=N, base=2)
-
     # Compute the rooflines
     achv_perf = roofline(len(hw_platforms),
-                         numpy.array([float(p[1]) for p in hw_platforms]),
-                         numpy.array([float(p[2]) for p in hw_platforms]),
-                         arithmetic_intensity)
-    norm_achv_perf = roofline(len(hw_platforms),
-                              numpy.array([(float(p[1])*1e3) / float(p[3])
-                                           for p in hw_platforms]),
-                              numpy.array([(float(p[2])*1e3) / float(p[3])
-                                           for p in hw_platforms]),
-                              arithmetic_intensity)
+                         hw_platforms['perf'].astype(numpy.float32),
+                         hw_platforms['bw'].astype(numpy.float32),
+                         ARITHMETIC_INTENSITY)
+    # min(s*a, s*b*I) == s*min(a, b*I) for s > 0, so the normalized roofline
+    # is the roofline scaled per platform by 1e3/price
+    norm_achv_perf = numpy.empty_like(achv_perf)
+    numpy.multiply(achv_perf, (1e3 / hw_platforms['price']).reshape(-1, 1),
+                   out=norm_achv_perf)
 
     # Apps
     if apps != []:
-        apps_intensity = numpy.array([float(a[1]) for a in apps])
+        apps_intensity = numpy.array([a[1] for a in apps], dtype=float)
 
     # Plot the graphs
     if xkcd:
@@ -88,8 +139,7 @@ def process(hw_platforms, apps, xkcd):
         axis.set_xlabel('Arithmetic Intensity (FLOP/byte)', fontsize=12)
         axis.grid(True, which='major')
 
-    matplotlib.pyplot.setp(axes, xticks=arithmetic_intensity,
-                           yticks=numpy.logspace(-5, 20, num=26, base=2))
+    matplotlib.pyplot.setp(axes, xticks=ARITHMETIC_INTENSITY, yticks=YTICKS)
 
     axes[0].set_ylabel("Achieveable Performance (GFLOP/s)", fontsize=12)
     axes[1].set_ylabel("Normalized Achieveable Performance (MFLOP/s/$)",
@@ -99,31 +149,118 @@ def process(hw_platforms, apps, xkcd):
     axes[1].set_title('Normalized Roofline Model', fontsize=14)
 
     for idx, val in enumerate(hw_platforms):
-        axes[0].plot(arithmetic_intensity, achv_perf[idx, 0:],
-                     label=val[0], marker='o')
-        axes[1].plot(arithmetic_intensity, norm_achv_perf[idx, 0:],
-                     label=val[0], marker='o')
+        axes[0].plot(ARITHMETIC_INTENSITY, achv_perf[idx, 0:],
+                     label=val[0], marker='o', rasterized=True)
+        axes[1].plot(ARITHMETIC_INTENSITY, norm_achv_perf[idx, 0:],
+                     label=val[0], marker='o', rasterized=True)
 
+    apps_handles = []
     if apps != []:
         color = matplotlib.pyplot.cm.rainbow(numpy.linspace(0, 1, len(apps)))
+        # All the apps intensities are drawn as a single collection of
+        # vertical lines spanning the full height of each axis
+        for axis in axes:
+            axis.add_collection(matplotlib.collections.LineCollection(
+                [[(x, 0), (x, 1)] for x in apps_intensity],
+                colors=color, linestyles=':',
+                transform=axis.get_xaxis_transform(), rasterized=True))
         for idx, val in enumerate(apps):
-            for axis in axes:
-                axis.axvline(apps_intensity[idx], label=val[0],
-                             linestyle=':', color=color[idx])
-                if len(val) > 2:
-                    assert len(val) % 2 == 0
-                    for cnt in range(2, len(val), 2):
-                        pair = [apps_intensity[idx], float(val[cnt+1])]
-                        axis.plot(pair[0], pair[1], 'rx')
+            # Legend proxy for the app's vertical line
+            apps_handles.append(matplotlib.lines.Line2D(
+                [], [], label=val[0], linestyle=':', color=color[idx]))
+            if len(val) > 2:
+                assert len(val) % 2 == 0
+                for cnt in range(2, len(val), 2):
+                    pair = [apps_intensity[idx], float(val[cnt+1])]
+                    for axis in axes:
+                        axis.plot(pair[0], pair[1], 'rx', rasterized=True)
                         axis.annotate(val[cnt], xy=(pair[0], pair[1]),
                                       textcoords='data')
 
     for axis in axes:
-        axis.legend()
+        handles, _ = axis.get_legend_handles_labels()
+        axis.legend(handles=handles + apps_handles)
     fig.tight_layout()
     matplotlib.pyplot.show()
 
 
+def read_hw_arrow(filename):
+    """
+    Reads the HW CSV file using PyArrow's multi-threaded CSV parser and
+    returns a structured array of HW_DTYPE, or None if pyarrow is missing
+    """
+    try:
+        import pyarrow.compute
+        import pyarrow.csv
+    except ImportError:
+        return None
+    fields = [field for field, _ in HW_DTYPE]
+    table = pyarrow.csv.read_csv(
+        filename,
+        read_options=pyarrow.csv.ReadOptions(column_names=fields),
+        parse_options=pyarrow.csv.ParseOptions(
+            invalid_row_handler=lambda row: ('skip' if row.text.startswith('#')
+                                             else 'error')),
+        convert_options=pyarrow.csv.ConvertOptions(
+            column_types={field: pyarrow.string() for field in fields}))
+    # Comments are only known once the rows are split, so all the columns
+    # are read as strings and converted after dropping the comment rows
+    table = table.filter(pyarrow.compute.invert(
+        pyarrow.compute.starts_with(table['name'], '#')))
+    if table.num_rows == 0:
+        raise ValueError("No HW platforms found")
+    hw_platforms = numpy.empty(table.num_rows, dtype=HW_DTYPE)
+    hw_platforms['name'] = table['name'].to_numpy()
+    for field in fields[1:]:
+        column = pyarrow.compute.utf8_trim_whitespace(table[field])
+        hw_platforms[field] = column.cast(pyarrow.float64()).to_numpy()
+    return hw_platforms
+
+
+def read_hw_text(text):
+    """
+    Parses the text of a HW CSV file and returns a structured array of
+    HW_DTYPE. Raises ValueError if a row is malformed.
+    """
+    # Comment rows may have any number of fields, so they are dropped while
+    # splitting, before the rows are mapped onto HW_DTYPE
+    rows = [tuple(row) for row in csv.reader(text.splitlines(), dialect='excel')
+            if row and not row[0].startswith('#')]
+    if not rows:
+        raise ValueError("No HW platforms found")
+    if any(len(row) != len(HW_DTYPE) for row in rows):
+        raise ValueError(f"Each row must contain exactly {len(HW_DTYPE)} "
+                         f"entries")
+    # NumPy converts each numeric field to float in C, field by field
+    return numpy.array(rows, dtype=HW_DTYPE)
+
+
+def read_hw_file(filename, csv_name):
+    """
+    Reads the HW CSV file and returns a structured array of HW_DTYPE
+    """
+    try:
+        if (filename is not None and
+                os.path.getsize(filename) >= ARROW_MIN_FILE_SIZE):
+            hw_platforms = read_hw_arrow(filename)
+            if hw_platforms is not None:
+                return hw_platforms
+        in_file = (open(filename, 'r', encoding='utf-8')
+                   if filename is not None else sys.stdin)
+        try:
+            hw_platforms = read_hw_text(in_file.read())
+        finally:
+            if in_file is not sys.stdin:
+                in_file.close()
+    except IOError as ex:
+        print(ex, file=sys.stderr)
+        sys.exit(1)
+    except ValueError as ex:
+        print(f"Error: Invalid {csv_name}: {ex}", file=sys.stderr)
+        sys.exit(1)
+    return hw_platforms
+
+
 def read_file(filename, row_len, csv_name, allow_variable_rows=False):
     """
     Reads CSV file and returns a list of row_len-ary tuples
@@ -132,7 +269,8 @@ def read_file(filename, row_len, csv_name, allow_variable_rows=False):
     elements = []
     try:
         fname = filename if filename is not None else sys.stdin
-        with open(fname, 'r', encoding='utf-8') as in_file:
+        with open(fname, 'r', encoding='utf-8',
+                  buffering=BUFFER_SIZE) as in_file:
             reader = csv.reader(in_file, dialect='excel')
             for row in reader:
                 if not row[0].startswith('#'):
@@ -156,7 +294,6 @@ def main():
     """
     main function
     """
-    hw_platforms = []
     apps = []
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", metavar="hw_csv",
@@ -168,7 +305,7 @@ def main():
     args = parser.parse_args()
     # HW
     print("Reading HW characteristics...")
-    hw_platforms = read_file(args.i, 4, "HW CSV")
+    hw_platforms = read_hw_file(args.i, "HW CSV")
     # apps
     if args.a is None:
         print("No application file given...")